@@ -1,13 +1,24 @@
+import os
+import sys
+import tempfile
 import math
+import json
 import colorsys
+import hashlib
 from pathlib import Path
 
 import streamlit as st
 import geopandas as gpd
 import pandas as pd
+import numpy as np
+import shapely
 import folium
-from folium.features import GeoJson, GeoJsonTooltip
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
+from folium.features import GeoJson, GeoJsonPopup, GeoJsonTooltip
+from branca.element import Template, MacroElement
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*`
+from src.paths import resolve_risk_path
 
 st.set_page_config(page_title="SD Heat Vulnerability & Cooling Optimization", layout="wide") 
 st.title("San Diego — Heat Vulnerability Index (HVI) & Cooling Coverage")
@@ -30,15 +41,88 @@ def plt_color(value):
     r,g,b = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
     return f"#{int(r*255):02x}{int(g*255):02x}{int(b*255):02x}"
 
-def load_gdf(p):
+# 256-step blue→red ramp, so per-tract colors are an index lookup instead of HSV math
+_COLOR_LUT = np.array([plt_color(i / 255) for i in range(256)])
+
+# Legend: the gradient only depends on the colormap; the title is filled in per map
+_STOPS = ", ".join(f"{plt_color(i/10)} {i*10}%" for i in range(11))
+_LEGEND_TEMPLATE = Template(f"""
+{{% macro html(this, kwargs) %}}
+<div style="position: fixed; bottom: 40px; left: 20px; z-index: 9999;
+            background: white; padding: 10px 12px; border: 1px solid #999; border-radius: 8px;">
+  <b>{{{{ this.title }}}}</b>
+  <div style="width:220px; height:12px; background: linear-gradient(to right, {_STOPS}); margin:6px 0;"></div>
+  <div style="display:flex; justify-content:space-between; font-size:12px;">
+    <span>Low</span><span>High</span>
+  </div>
+</div>
+{{% endmacro %}}
+""")
+
+PROC_DIR = Path("data/processed")
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _proc_dir():
+    """One scandir of data/processed → {name: mtime}; refreshed at most every 30 s."""
+    try:
+        return {e.name: e.stat().st_mtime for e in os.scandir(PROC_DIR) if e.is_file()}
+    except FileNotFoundError:
+        return {}
+
+def _mtime(p):
+    """Modification time used as a cache key (None if the file is missing)."""
     p = Path(p)
-    if not p.exists():
+    if p.parent == PROC_DIR:  # most inputs: answered from the cached listing, no stat
+        return _proc_dir().get(p.name)
+    return p.stat().st_mtime if p.exists() else None
+
+def _read_vector(path: str, **kw):
+    """GeoParquet via read_parquet; everything else (GeoJSON, GPKG, FlatGeobuf) via OGR."""
+    if Path(path).suffix.lower() == ".parquet":
+        return gpd.read_parquet(path, **kw)
+    return gpd.read_file(path, **kw)
+
+# Cached readers: keyed on path + mtime, so reruns skip disk I/O until a file changes
+@st.cache_data(show_spinner=False)
+def load_gdf(path: str, mtime):
+    if mtime is None:
+        return None
+    return _read_vector(path).to_crs(4326)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_layer(path: str, mtime, layer: str):
+    if mtime is None:
+        return None
+    return gpd.read_file(path, layer=layer).to_crs(4326)
+
+@st.cache_data(show_spinner=False)
+def load_hhi(path: str, mtime):
+    if mtime is None:
+        return None
+    hhi_df = pd.read_csv(path, dtype={"GEOID": str})
+    # be tolerant about the column name coming from your ingest
+    if "CDC_HHI" not in hhi_df.columns:
+        for cand in ["HHI", "hhi", "HHI_norm", "index", "hhi_score"]:
+            if cand in hhi_df.columns:
+                hhi_df = hhi_df.rename(columns={cand: "CDC_HHI"})
+                break
+    return hhi_df
+
+@st.cache_data(show_spinner=False)
+def load_risk(path: str, mtime):
+    if mtime is None:
         return None
-    return gpd.read_file(p)
+    if Path(path).suffix.lower() == ".parquet":
+        return pd.read_parquet(path, columns=["GEOID", "RISK"])
+    return pd.DataFrame(gpd.read_file(path, ignore_geometry=True)[["GEOID", "RISK"]])
 
 # Sidebar 
 st.sidebar.header("Data Inputs")
-tracts_path   = st.sidebar.text_input("Tracts with HVI (GeoJSON)", "data/processed/tracts_hvi.geojson")
+# Prefer the slim WGS84 layer from scripts/finalize_tracts.py; fall back to the raw HVI output
+WEB_TRACTS = "data/processed/tracts_hvi_web.parquet"
+RAW_TRACTS = "data/processed/tracts_hvi.geojson"
+tracts_path   = st.sidebar.text_input("Tracts with HVI (GeoParquet/FlatGeobuf/GeoJSON)",
+                                      WEB_TRACTS if _mtime(WEB_TRACTS) is not None else RAW_TRACTS)
 sites_path    = st.sidebar.text_input("Existing Cooling Sites (GeoJSON)", "data/processed/cooling_sites.geojson")
 opt_sites_in  = st.sidebar.text_input("Optimized Sites (optional, GeoJSON)", "data/processed/optimized_k5.geojson")
 
@@ -49,66 +133,56 @@ show_sites = st.sidebar.checkbox("Show existing sites", True)
 show_opt   = st.sidebar.checkbox("Show optimized sites", True)
 
 # If a precomputed optimized_k{k}.geojson exists, use it automatically
-auto_opt_path = Path(f"data/processed/optimized_k{k}.geojson")
-opt_sites_path = str(auto_opt_path if auto_opt_path.exists() else Path(opt_sites_in))
+auto_opt_name = f"optimized_k{k}.geojson"
+opt_sites_path = str(PROC_DIR / auto_opt_name if auto_opt_name in _proc_dir() else Path(opt_sites_in))
 
 # Load data 
-g_tracts = load_gdf(tracts_path)
+g_tracts = load_gdf(tracts_path, _mtime(tracts_path))
 if g_tracts is None:
     st.error(f"Tracts file not found: {tracts_path}")
     st.stop()
 
-g_tracts = g_tracts.to_crs(4326)
-g_sites  = load_gdf(sites_path)
-g_opt    = load_gdf(opt_sites_path)
-if g_sites is not None: g_sites = g_sites.to_crs(4326)
-if g_opt   is not None: g_opt   = g_opt.to_crs(4326)
+g_sites  = load_gdf(sites_path, _mtime(sites_path))
+g_opt    = load_gdf(opt_sites_path, _mtime(opt_sites_path))
 
 # CDC Heat & Health Index (tract-level, derived from ZCTAs)
-_hhi_csv = Path("data/processed/hhi_tract.csv")
-if _hhi_csv.exists():
-    hhi_df = pd.read_csv(_hhi_csv, dtype={"GEOID": str})
-    # be tolerant about the column name coming from your ingest
-    if "CDC_HHI" not in hhi_df.columns:
-        for cand in ["HHI", "hhi", "HHI_norm", "index", "hhi_score"]:
-            if cand in hhi_df.columns:
-                hhi_df = hhi_df.rename(columns={cand: "CDC_HHI"})
-                break
-    if "CDC_HHI" in hhi_df.columns:
-        g_tracts = g_tracts.merge(hhi_df[["GEOID", "CDC_HHI"]], on="GEOID", how="left")
-
-# Map init (with fallback center) 
-try:
-    ctr = g_tracts.geometry.union_all().centroid
-    center = [ctr.y, ctr.x]
-    if not all(map(math.isfinite, center)):
-        raise ValueError
-except Exception:
-    center = [32.8, -117.1]   # San Diego fallback
-
-m = folium.Map(location=center, zoom_start=10, tiles="cartodbpositron")
-
-#  Baseline coverage (if present) 
-_cov = Path("data/processed/coverage.gpkg")
-if _cov.exists():
+_hhi_csv = "data/processed/hhi_tract.csv"
+hhi_df = load_hhi(_hhi_csv, _mtime(_hhi_csv))
+if "CDC_HHI" not in g_tracts.columns and hhi_df is not None and "CDC_HHI" in hhi_df.columns:
+    g_tracts = g_tracts.merge(hhi_df[["GEOID", "CDC_HHI"]], on="GEOID", how="left")
+
+#  Baseline / after coverage (if present) 
+cov = None
+_cov = "data/processed/coverage.gpkg"
+if _mtime(_cov) is not None:
     try:
-        cov = gpd.read_file(_cov, layer="coverage").to_crs(4326)
-        folium.GeoJson(
-            cov.to_json(),
-            name="15-min Coverage (baseline)",
-            style_function=lambda f: {"color": "#555", "weight": 1, "fillOpacity": 0.03},
-        ).add_to(m)
+        cov = load_layer(_cov, _mtime(_cov), "coverage")
     except Exception as e:
         st.sidebar.warning(f"Could not read baseline coverage: {e}")
 
+cov_after = None
+_after = f"data/processed/coverage_after_k{k}.gpkg"
+if _mtime(_after) is not None:
+    try:
+        cov_after = load_layer(_after, _mtime(_after), "coverage")
+    except Exception as e:
+        st.sidebar.warning(f"Could not read after-coverage for k={k}: {e}")
+
 # Tracts (HVI / Risk / CDC HHI) 
 
 # Try to join in predicted risk (if not already present)
-risk_path = Path("data/processed/tracts_risk.geojson")
-if "RISK" not in g_tracts.columns and risk_path.exists():
-    g_risk = gpd.read_file(risk_path)[["GEOID", "RISK"]]
+risk_path = str(resolve_risk_path())  # .fgb, or the .geojson from older src/risk.py runs
+if "RISK" not in g_tracts.columns and _mtime(risk_path) is not None:
+    g_risk = load_risk(risk_path, _mtime(risk_path))
     g_tracts = g_tracts.merge(g_risk, on="GEOID", how="left")
 
+# Metric columns as float32 (no-op for the finalized layer, which is stored that way)
+for c in ("HVI", "RISK", "CDC_HHI"):
+    if c in g_tracts.columns:
+        g_tracts[c] = pd.to_numeric(g_tracts[c], errors="coerce").astype("float32")
+
+tracts_stamp = tuple((p, _mtime(p)) for p in (tracts_path, _hhi_csv, risk_path))
+
 # Sidebar radio: show CDC HHI only if present
 options = ["HVI", "Risk (predicted events per 10k)"]
 if "CDC_HHI" in g_tracts.columns:
@@ -122,114 +196,223 @@ metric_map = {
     "Risk (predicted events per 10k)": "RISK",
     "CDC HHI": "CDC_HHI"
 }
-metric_col = metric_map[color_by]
-layer_name = f"Tracts ({'Risk' if metric_col=='RISK' else ('CDC HHI' if metric_col=='CDC_HHI' else 'HVI')})"
+# short labels for the legend title and the hover tooltip
+metric_label = {"GEOID": "GEOID", "HVI": "HVI", "RISK": "Risk (predicted)", "CDC_HHI": "CDC HHI"}
 
-def style_fn_factory(metric):
-    def _fn(feat):
-        raw = feat["properties"].get(metric)
-        try:
-            v = float(raw) if raw is not None else 0.0
-        except Exception:
-            v = 0.0
-        return {"fillColor": plt_color(v), "color": "#333", "weight": 0.4, "fillOpacity": 0.65}
-    return _fn
-
-tip_cols = [c for c in ["GEOID", "HVI", "RISK", "CDC_HHI"] if c in g_tracts.columns]
-tooltip = GeoJsonTooltip(fields=tip_cols, aliases=tip_cols, localize=True)
-
-GeoJson(
-    g_tracts.to_json(),
-    name=layer_name,
-    style_function=style_fn_factory(metric_col),
-    tooltip=tooltip,
-).add_to(m)
-
-# Existing sites 
-if show_sites and g_sites is not None and len(g_sites) > 0:
-    fg = folium.FeatureGroup(name="Existing sites")
-    for _, r in g_sites.iterrows():
-        folium.CircleMarker(
-            [r.geometry.y, r.geometry.x],
-            radius=4, color="#0057ff", fill=True, fill_opacity=0.9,
-            popup=r.get("name","Site")
-        ).add_to(fg)
-    fg.add_to(m)
-elif show_sites and (g_sites is None or len(g_sites) == 0):
+if show_sites and (g_sites is None or len(g_sites) == 0):
     st.sidebar.info(f"No sites found in {sites_path}")
 
-# Optimized sites (friendlier popup) 
+_UTM = 32611  # UTM zone 11N (San Diego)
+
+@st.cache_resource(show_spinner=False)
+def _tract_tree(_g_tracts, tracts_stamp):
+    """STRtree over tract polygons in meters, plus the GEOID/HVI rows it indexes."""
+    geoms = _g_tracts.geometry.to_crs(_UTM).to_numpy()
+    return shapely.STRtree(geoms), _g_tracts[["GEOID", "HVI"]].reset_index(drop=True)
+
+@st.cache_data(show_spinner=False)
+def tract_center(_g_tracts, tracts_stamp):
+    """Map center (lat, lon): the sidecar written by finalize_tracts.py, else the union centroid."""
+    tracts_file = Path(tracts_stamp[0][0])
+    sidecar = tracts_file.with_name(f"{tracts_file.stem}_center.json")
+    try:
+        lat, lon = json.loads(sidecar.read_text())["center"]
+    except Exception:
+        ctr = _g_tracts.geometry.union_all().centroid
+        lat, lon = ctr.y, ctr.x
+    return (float(lat), float(lon))
+
+# Optimized sites: attach tract info for friendlier popups
 if show_opt and g_opt is not None and len(g_opt) > 0:
     # If optimized points don't already carry tract info, join it from tracts
     lower_cols = {c.lower() for c in g_opt.columns}
     if not ({"geoid", "hvi"} <= lower_cols) and len(g_tracts) > 0:
-        # prepare tracts to join
-        join_cols = g_tracts[["GEOID", "HVI", "geometry"]].rename(
-            columns={"GEOID": "geoid", "HVI": "hvi"}
-        )
-
-        # project both to meters, join, then back to WGS84
-        _utm = 32611  # UTM zone 11N (San Diego)
-        g_opt_utm  = g_opt.to_crs(_utm)
-        join_utm   = join_cols.to_crs(_utm)
-
-        g_opt = gpd.sjoin_nearest(
-            g_opt_utm, join_utm[["geoid", "hvi", "geometry"]],
-            how="left", distance_col="dist_m"
-        ).to_crs(4326)
-
-        if "index_right" in g_opt.columns:
-            g_opt = g_opt.drop(columns=["index_right"])
-
-    # draw optimized points
-    fg2 = folium.FeatureGroup(name=f"Optimized (k={k})")
-    for _, r in g_opt.iterrows():
-        geoid = r.get("geoid") or r.get("GEOID") or "unknown"
-        hvi_v = r.get("hvi") if "hvi" in r else r.get("HVI")
-
-        base = (r.get("name") or "").strip()
-        if base.startswith("Cand_"):  # hide opaque ids
-            base = ""
-
-        popup_txt = base or f"New site — tract {geoid}"
+        # nearest tract in meters, via the cached tree (shared across k values)
+        tree, tr_attrs = _tract_tree(g_tracts, tracts_stamp)
+        pts = g_opt.geometry.to_crs(_UTM)
+        ok = (pts.notna() & ~pts.is_empty).to_numpy()
+        geoid = np.full(len(g_opt), None, dtype=object)
+        hvi = np.full(len(g_opt), np.nan)
+        if ok.any():
+            idx = tree.nearest(pts.to_numpy()[ok])
+            geoid[ok] = tr_attrs["GEOID"].to_numpy()[idx]
+            hvi[ok] = tr_attrs["HVI"].to_numpy(dtype=float)[idx]
+        g_opt = g_opt.assign(geoid=geoid, hvi=hvi)
+
+def fill_colors(g, metric):
+    """Per-tract fill colors (GEOID -> hex) via one LUT lookup; missing/NaN → low end."""
+    vals = pd.to_numeric(g[metric], errors="coerce") if metric in g.columns else pd.Series(0.0, index=g.index)
+    idx = np.clip(np.rint(np.nan_to_num(vals.to_numpy(dtype=float)) * 255), 0, 255).astype(np.uint8)
+    return dict(zip(g["GEOID"], _COLOR_LUT[idx]))
+
+def style_fn_factory(fills):
+    def _fn(feat):
+        fill = fills.get(feat["properties"].get("GEOID"), _COLOR_LUT[0])
+        return {"fillColor": fill, "color": "#333", "weight": 0.4, "fillOpacity": 0.65}
+    return _fn
+
+def _opt_popups(g):
+    """Popup text per optimized site, built column-wise: name (or tract) + HVI."""
+    blank = pd.Series("", index=g.index)
+    base = g["name"].fillna("").astype(str).str.strip() if "name" in g.columns else blank
+    base = base.mask(base.str.startswith("Cand_"), "")  # hide opaque ids
+
+    geoid = blank
+    for c in ("geoid", "GEOID"):
+        if c in g.columns:
+            geoid = geoid.mask(geoid == "", g[c].fillna("").astype(str))
+    geoid = geoid.replace("", "unknown")
+
+    hvi_c = "hvi" if "hvi" in g.columns else "HVI"
+    hvi = pd.to_numeric(g[hvi_c], errors="coerce") if hvi_c in g.columns else pd.Series(np.nan, index=g.index)
+
+    txt = base.where(base != "", "New site — tract " + geoid)
+    return txt + np.where(hvi.notna(), "\nHVI: " + hvi.map("{:.3f}".format), "")
+
+# Tracts are served to the browser as a static file (server.enableStaticServing in
+# .streamlit/config.toml) instead of being embedded in the page. Streamlit serves
+# app/static/ at <host>/app/static/, so with the app launched from the repo root
+# the same relative path works for both the Python-side read and the browser URL.
+STATIC_DIR = Path("app/static")
+# Published copies kept on disk: at least render_map_html's max_entries, so no cached map
+# outlives its file; the current version is re-touched every rerun and so never pruned.
+KEEP_PUBLISHED = 8
+
+def publish_tracts(g, tracts_stamp) -> str:
+    """Write a minified, ~1 m precision copy of the tracts once per input version; return its URL."""
+    digest = hashlib.md5(repr(tracts_stamp).encode()).hexdigest()[:12]
+    dst = STATIC_DIR / f"tracts_{digest}.geojson"
+    try:
+        os.utime(dst)  # already published: mark as in use, so pruning keeps it
+        return str(dst)
+    except FileNotFoundError:
+        pass
+
+    STATIC_DIR.mkdir(parents=True, exist_ok=True)
+    # only what the map uses; GEOID first so folium picks it as the feature key
+    web = g[[c for c in ["GEOID", "HVI", "RISK", "CDC_HHI"] if c in g.columns] + ["geometry"]].copy()
+    for c in ("HVI", "RISK", "CDC_HHI"):
+        if c in web.columns:
+            # round in float64: float32 values would serialize as 0.21699999...
+            web[c] = web[c].astype(float).round(3)
+    web["geometry"] = web.geometry.set_precision(1e-5)
+    # write-then-rename: another session must never see (and json.loads) a half-written file
+    fd, tmp = tempfile.mkstemp(dir=STATIC_DIR, prefix=dst.stem + ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(web.to_json(drop_id=True))
+    os.replace(tmp, dst)
+
+    # the digest changes whenever an input is regenerated, so drop all but the newest copies
+    published = []
+    for p in STATIC_DIR.glob("tracts_*.geojson"):
         try:
-            if hvi_v is not None:
-                popup_txt += f"\nHVI: {float(hvi_v):.3f}"
-        except Exception:
+            published.append((p.stat().st_mtime, p))
+        except FileNotFoundError:  # pruned by another session meanwhile
             pass
+    for _, p in sorted(published, reverse=True)[KEEP_PUBLISHED:]:
+        p.unlink(missing_ok=True)
+    return str(dst)
+
+# Map HTML: built and rendered in one cached call per (k, minutes, color_by, show_sites,
+# show_opt) + input paths/mtimes. Only the string is cached; folium.Map is mutable and
+# re-rendering one appends its layers to the page again, so no Map outlives the call.
+# Underscored args are the already-cached frames; Streamlit skips hashing them.
+@st.cache_data(show_spinner=False, max_entries=8)
+def render_map_html(_g_tracts, _g_sites, _g_opt, _cov, _cov_after,
+                    k, minutes, color_by, show_sites, show_opt, tracts_stamp, tracts_url, stamp) -> str:
+    g_tracts, g_sites, g_opt = _g_tracts, _g_sites, _g_opt
+
+    # Map init (with fallback center) 
+    try:
+        center = list(tract_center(g_tracts, tracts_stamp))
+        if not all(map(math.isfinite, center)):
+            raise ValueError
+    except Exception:
+        center = [32.8, -117.1]   # San Diego fallback
 
-        folium.CircleMarker(
-            [r.geometry.y, r.geometry.x],
-            radius=5, color="#e31a1c", fill=True, fill_opacity=0.95,
-            popup=popup_txt,
-        ).add_to(fg2)
+    m = folium.Map(location=center, zoom_start=10, tiles="cartodbpositron")
 
-    fg2.add_to(m)
+    #  Baseline coverage (if present) 
+    if _cov is not None:
+        folium.GeoJson(
+            _cov.to_json(),
+            name="15-min Coverage (baseline)",
+            style_function=lambda f: {"color": "#555", "weight": 1, "fillOpacity": 0.03},
+        ).add_to(m)
 
-# After coverage for current k 
-_after = Path(f"data/processed/coverage_after_k{k}.gpkg")
-if _after.exists():
-    try:
-        cov_after = gpd.read_file(_after, layer="coverage").to_crs(4326)
+    # Tracts (HVI / Risk / CDC HHI) 
+    metric_col = metric_map[color_by]
+    layer_name = f"Tracts ({'Risk' if metric_col=='RISK' else ('CDC HHI' if metric_col=='CDC_HHI' else 'HVI')})"
+
+    # Hover shows only the colored metric; the full attribute list is a click popup
+    tip_cols = [c for c in ["GEOID", "HVI", "RISK", "CDC_HHI"] if c in g_tracts.columns]
+    hover_col = metric_col if metric_col in tip_cols else tip_cols[0]
+    tooltip = GeoJsonTooltip(fields=[hover_col], aliases=[metric_label[hover_col]], localize=True)
+    popup = GeoJsonPopup(fields=tip_cols, aliases=tip_cols, localize=True)
+
+    GeoJson(
+        tracts_url,
+        embed=False,
+        name=layer_name,
+        style_function=style_fn_factory(fill_colors(g_tracts, metric_col)),
+        tooltip=tooltip,
+        popup=popup,
+    ).add_to(m)
+
+    # Existing sites: one GeoJson layer, markers styled client-side
+    if show_sites and g_sites is not None and len(g_sites) > 0:
+        names = g_sites["name"].fillna("Site") if "name" in g_sites.columns else "Site"
+        pts = g_sites[["geometry"]].assign(_popup=names)
+        GeoJson(
+            pts.to_json(),
+            name="Existing sites",
+            marker=folium.CircleMarker(radius=4, color="#0057ff", fill=True, fill_opacity=0.9),
+            popup=GeoJsonPopup(fields=["_popup"], labels=False),
+        ).add_to(m)
+
+    # Optimized sites (friendlier popup) 
+    if show_opt and g_opt is not None and len(g_opt) > 0:
+        pts = g_opt[["geometry"]].assign(_popup=_opt_popups(g_opt))
+        GeoJson(
+            pts.to_json(),
+            name=f"Optimized (k={k})",
+            marker=folium.CircleMarker(radius=5, color="#e31a1c", fill=True, fill_opacity=0.95),
+            popup=GeoJsonPopup(fields=["_popup"], labels=False),
+        ).add_to(m)
+
+    # After coverage for current k 
+    if _cov_after is not None:
         folium.GeoJson(
-            cov_after.to_json(),
+            _cov_after.to_json(),
             name=f"{minutes}-min Coverage (after, k={k})",
             style_function=lambda f: {"color": "#e31a1c", "weight": 2, "fillOpacity": 0.05},
         ).add_to(m)
-    except Exception as e:
-        st.sidebar.warning(f"Could not read after-coverage for k={k}: {e}")
+
+    #  Legend + controls 
+    macro = MacroElement()
+    macro._template = _LEGEND_TEMPLATE
+    macro.title = metric_label.get(metric_col, "HVI")
+    m.get_root().add_child(macro)
+
+    folium.LayerControl(collapsed=False).add_to(m)
+    return m.get_root().render()
 
 # Coverage summary (single block) 
 from pathlib import Path
 import pandas as _pd
-import geopandas as _gpd
 
-def _read_summary_csv(gpkg_path: str):
+@st.cache_data(show_spinner=False, max_entries=8)
+def _read_summary_csv(gpkg_path: str, mtime):
     csvp = Path(gpkg_path.replace(".gpkg", "_summary.csv"))
-    return _pd.read_csv(csvp) if csvp.exists() else None
+    return _pd.read_csv(csvp) if mtime is not None else None
+
+def _summary_mtime(gpkg_path: str):
+    return _mtime(gpkg_path.replace(".gpkg", "_summary.csv"))
 
-base_sum  = _read_summary_csv("data/processed/coverage.gpkg")
-after_sum = _read_summary_csv(f"data/processed/coverage_after_k{k}.gpkg")
+base_sum  = _read_summary_csv("data/processed/coverage.gpkg",
+                              _summary_mtime("data/processed/coverage.gpkg"))
+after_sum = _read_summary_csv(f"data/processed/coverage_after_k{k}.gpkg",
+                              _summary_mtime(f"data/processed/coverage_after_k{k}.gpkg"))
 
 st.markdown("### Coverage summary")
 c1, c2, c3, c4 = st.columns(4)
@@ -249,22 +432,48 @@ if after_sum is not None:
         c3.metric("Population covered (after)",
                   f"{float(after_sum.iloc[0]['pct_pop_covered']):.1f}%")
 
-# Compute HVI-weighted coverage (after) and show “top uncovered” table
-g_after = None
-_after_gpkg = Path(f"data/processed/coverage_after_k{k}.gpkg")
-if _after_gpkg.exists():
+# HVI-weighted coverage (after) and “top uncovered” table, both precomputed by src/coverage.py
+@st.cache_data(show_spinner=False, max_entries=8)
+def _read_top_uncovered(csv_path: str, mtime):
+    return _pd.read_csv(csv_path, dtype={"GEOID": str}) if mtime is not None else None
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _coverage_from_gpkg(gpkg_path: str, mtime):
+    """(hvi_weighted_pct, top uncovered) from the tracts_with_coverage layer, as src/coverage.py computes them.
+    For outputs of older coverage runs, which wrote neither to CSV."""
+    if mtime is None:
+        return None, None
+    t = gpd.read_file(gpkg_path, layer="tracts_with_coverage", ignore_geometry=True)
+    if "HVI" not in t.columns or "covered" not in t.columns:
+        return None, None
+    covered = t["covered"].astype(bool)
+    hvi = _pd.to_numeric(t["HVI"], errors="coerce")
+    w = hvi.clip(0, 1)
+    top = (t.loc[~covered, ["GEOID"]].astype(str).assign(HVI=hvi[~covered])
+            .sort_values("HVI", ascending=False)
+            .head(10))
+    return 100.0 * (covered * w).sum() / (w.sum() + 1e-9), top
+
+hvi_pct = None
+if after_sum is not None and 'hvi_weighted_pct' in after_sum.columns and _pd.notna(after_sum.iloc[0]['hvi_weighted_pct']):
+    hvi_pct = float(after_sum.iloc[0]['hvi_weighted_pct'])
+
+_top_csv = f"data/processed/coverage_after_k{k}_top_uncovered.csv"
+todo = _read_top_uncovered(_top_csv, _mtime(_top_csv))
+
+if hvi_pct is None or todo is None:
     try:
-        g_after = _gpd.read_file(_after_gpkg, layer="tracts_with_coverage")
-        w = g_after["HVI"].clip(0, 1)
-        hvi_w = 100.0 * (g_after["covered"] * w).sum() / (w.sum() + 1e-9)
-        c4.metric("HVI-weighted coverage (after)", f"{hvi_w:.1f}%")
+        gpkg_pct, gpkg_top = _coverage_from_gpkg(_after, _mtime(_after))
     except Exception as e:
-        st.sidebar.warning(f"Could not compute HVI-weighted coverage: {e}")
+        gpkg_pct, gpkg_top = None, None
+        st.warning(f"Could not read tract coverage for k={k}: {e}")
+    hvi_pct = gpkg_pct if hvi_pct is None else hvi_pct
+    todo = gpkg_top if todo is None else todo
 
-if g_after is not None:
-    todo = (g_after.loc[~g_after["covered"], ["GEOID", "HVI"]]
-                  .sort_values("HVI", ascending=False)
-                  .head(10))
+if hvi_pct is not None:
+    c4.metric("HVI-weighted coverage (after)", f"{hvi_pct:.1f}%")
+
+if todo is not None:
     st.caption("Highest-HVI tracts still uncovered")
     st.dataframe(todo, hide_index=True)
 
@@ -277,32 +486,13 @@ st.markdown(
 """
 )
 
-#  Legend + controls 
-legend_title = {"HVI": "HVI", "RISK": "Risk (predicted)", "CDC_HHI": "CDC HHI"}.get(metric_col, "HVI")
-stops = ", ".join([f"{plt_color(i/10)} {i*10}%" for i in range(11)])
-
-legend_html = f"""
-{{% macro html(this, kwargs) %}}
-<div style="position: fixed; bottom: 40px; left: 20px; z-index: 9999;
-            background: white; padding: 10px 12px; border: 1px solid #999; border-radius: 8px;">
-  <b>{legend_title}</b>
-  <div style="width:220px; height:12px; background: linear-gradient(to right, {stops}); margin:6px 0;"></div>
-  <div style="display:flex; justify-content:space-between; font-size:12px;">
-    <span>Low</span><span>High</span>
-  </div>
-</div>
-{{% endmacro %}}
-"""
-
-from branca.element import Template, MacroElement
-macro = MacroElement()
-macro._template = Template(legend_html)
-m.get_root().add_child(macro)
-
-folium.LayerControl(collapsed=False).add_to(m)
-
 #  RENDER MAP 
-st_folium(m, use_container_width=True, returned_objects=[], key="main_map")
+stamp = tuple((p, _mtime(p)) for p in (sites_path, opt_sites_path, _cov, _after))
+# published outside the caches: re-created here if it was pruned while its map stayed cached
+tracts_url = publish_tracts(g_tracts, tracts_stamp)
+map_key = (k, minutes, color_by, show_sites, show_opt, tracts_stamp, tracts_url, stamp)
+# returned_objects=[] meant st_folium never sent state back, so a static component is equivalent
+components.html(render_map_html(g_tracts, g_sites, g_opt, cov, cov_after, *map_key), height=700)
 
 # Notes / Help 
 st.markdown("### How to read & use this map")
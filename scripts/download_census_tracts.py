@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
-import argparse, io, zipfile, sys
+import argparse, tempfile, zipfile, sys
 import geopandas as gpd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 
 # Download Census tracts for a given state/year, then filter a target county.
@@ -20,13 +22,21 @@ def main():
 
     url = URL_FMT.format(year=args.year, state=args.state)
     print(f"Downloading: {url}")
-    r = requests.get(url, timeout=300)
-    r.raise_for_status()
-
-    z = zipfile.ZipFile(io.BytesIO(r.content))
+    s = requests.Session()
+    s.mount("https://", HTTPAdapter(max_retries=Retry(total=3, backoff_factor=1,
+                                                      status_forcelist=[429, 500, 502, 503, 504])))
     tmpdir = Path("data/raw/tiger_tracts")
     tmpdir.mkdir(parents=True, exist_ok=True)
-    z.extractall(tmpdir)
+
+    # Stream the zip to a spooled temp file (spills to disk past 64 MB) instead of holding r.content
+    with s.get(url, stream=True, timeout=300) as r:
+        r.raise_for_status()
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as fp:
+            for chunk in r.iter_content(chunk_size=1 << 20):
+                fp.write(chunk)
+            fp.seek(0)
+            with zipfile.ZipFile(fp) as z:
+                z.extractall(tmpdir)
 
     shp = None
     for f in tmpdir.iterdir():
@@ -37,8 +47,8 @@ def main():
         print("Could not find shapefile in the zip.", file=sys.stderr)
         sys.exit(1)
 
-    g = gpd.read_file(shp)
-    g = g[g["COUNTYFP"] == str(args.county)]
+    # filter in OGR so only the county's tracts are materialized, not the whole state
+    g = gpd.read_file(shp, where=f"COUNTYFP = '{args.county}'")
     g = g.to_crs(3857)
 
     out = Path(args.out)
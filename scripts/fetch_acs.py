@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import argparse, os, sys, json
+import numpy as np
 import pandas as pd
 import requests
 from pathlib import Path
@@ -52,11 +53,12 @@ def main():
     # Ensure every requested var exists; if not, create as NA
     for v in ALL_VARS:
         if v not in df.columns:
-            df[v] = pd.NA
+            df[v] = np.nan
 
-    # Convert numerics safely (skip NAME/state/county/tract)
-    for c in [c for c in df.columns if c not in ("NAME","state","county","tract")]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+    # Convert numerics safely (skip NAME/state/county/tract): one coercing pass over the whole block
+    num_cols = df.columns.difference(["NAME","state","county","tract"])
+    block = df[num_cols].to_numpy(dtype=object)
+    df[num_cols] = pd.to_numeric(block.ravel(), errors="coerce").reshape(block.shape)
 
     # GEOID (11-digit)
     df["GEOID"] = df["state"] + df["county"] + df["tract"]
@@ -82,7 +84,7 @@ def main():
     keep = ["GEOID","population","pct_age65p","no_vehicle","limited_english",
             "renters_pct","crowding_pct","income_median_neg"]
     out = Path(args.out); out.parent.mkdir(parents=True, exist_ok=True)
-    df[keep].to_parquet(out, index=False)
+    df[keep].to_parquet(out, index=False, engine="pyarrow", compression="zstd")
     print(f"Wrote {out} ({len(df)} tracts).")
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+from pathlib import Path
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.paths import resolve_risk_path
+
+# Build the tract layer the Streamlit app loads: WGS84, HHI + RISK merged in,
+# and only the columns the map uses. Doing this once offline keeps CRS
+# transforms and merges off the app's rerun path.
+
+KEEP = ["GEOID", "HVI", "RISK", "CDC_HHI", "geometry"]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tracts", default="data/processed/tracts_hvi.geojson")
+    ap.add_argument("--hhi_csv", default="data/processed/hhi_tract.csv")
+    ap.add_argument("--risk", default=str(resolve_risk_path()))
+    ap.add_argument("--out", default="data/processed/tracts_hvi_web.parquet",
+                    help=".parquet (GeoParquet) or .fgb (FlatGeobuf); other suffixes via OGR")
+    args = ap.parse_args()
+
+    g = gpd.read_file(args.tracts).to_crs(4326)
+    g["GEOID"] = g["GEOID"].astype(str)
+
+    hhi_csv = Path(args.hhi_csv)
+    if "CDC_HHI" not in g.columns and hhi_csv.exists():
+        hhi = pd.read_csv(hhi_csv, dtype={"GEOID": str})
+        if "CDC_HHI" in hhi.columns:
+            g = g.merge(hhi[["GEOID", "CDC_HHI"]], on="GEOID", how="left")
+            print(f"[web] merged CDC_HHI from {hhi_csv}")
+
+    risk = Path(args.risk)
+    if "RISK" not in g.columns and risk.exists():
+        r = gpd.read_file(risk, ignore_geometry=True)[["GEOID", "RISK"]]
+        g = g.merge(r.astype({"GEOID": str}), on="GEOID", how="left")
+        print(f"[web] merged RISK from {risk}")
+
+    g = g[[c for c in KEEP if c in g.columns]].copy()
+    # 0–1 indexes: 3 decimals is plenty for coloring/tooltips; float32 halves the bytes
+    for c in ("HVI", "RISK", "CDC_HHI"):
+        if c in g.columns:
+            g[c] = pd.to_numeric(g[c], errors="coerce").round(3).astype("float32")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    if out.suffix.lower() == ".parquet":
+        g.to_parquet(out, index=False)
+    else:
+        g.to_file(out)  # driver inferred from suffix (.fgb → FlatGeobuf, .gpkg → GPKG)
+    print(f"[web] wrote {out} ({len(g)} tracts, columns: {', '.join(g.columns)})")
+
+    # Map center sidecar, so the app doesn't union every tract polygon to place the map
+    ctr = g.geometry.union_all().centroid
+    sidecar = out.with_name(f"{out.stem}_center.json")
+    sidecar.write_text(json.dumps({"center": [round(ctr.y, 6), round(ctr.x, 6)]}))
+    print(f"[web] wrote {sidecar}")
+
+if __name__ == "__main__":
+    main()
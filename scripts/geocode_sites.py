@@ -1,35 +1,47 @@
 #!/usr/bin/env python3
-import argparse
+import argparse, shelve
 import pandas as pd
 from geopy.geocoders import Nominatim
 from geopy.extra.rate_limiter import RateLimiter
 import geopandas as gpd
-from shapely.geometry import Point
 from pathlib import Path
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in_csv", required=True, help="CSV with columns: name,address,city,state,zip")
-    ap.add_argument("--out", default="data/processed/cooling_sites.geojson")
+    ap.add_argument("--out", default="data/processed/cooling_sites.geojson",
+                    help="GeoJSON output (.geojsonl/.geojsons for newline-delimited)")
+    ap.add_argument("--cache", default="data/cache/geocode.db", help="On-disk address → lat/lon cache")
     args = ap.parse_args()
 
     df = pd.read_csv(args.in_csv)
     geolocator = Nominatim(user_agent="sd-heat-hvi")
     geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1.1)
 
-    lats, lons = [], []
-    for _, row in df.iterrows():
-        q = f"{row['address']}, {row.get('city','')}, {row.get('state','')}, {row.get('zip','')}"
-        loc = geocode(q)
-        if loc is None:
-            lats.append(None); lons.append(None)
-        else:
-            lats.append(loc.latitude); lons.append(loc.longitude)
+    queries = [f"{row['address']}, {row.get('city','')}, {row.get('state','')}, {row.get('zip','')}"
+               for _, row in df.iterrows()]
 
-    df["lat"] = lats; df["lon"] = lons
-    gdf = gpd.GeoDataFrame(df, geometry=[Point(xy) if pd.notna(xy[0]) and pd.notna(xy[1]) else None for xy in zip(df["lon"], df["lat"])], crs=4326)
+    # Persistent address cache: only new (unique) queries hit Nominatim.
+    # Misses aren't cached, so transient failures are retried on the next run.
+    Path(args.cache).parent.mkdir(parents=True, exist_ok=True)
+    with shelve.open(args.cache) as cache:
+        todo = [q for q in dict.fromkeys(queries) if q not in cache]
+        print(f"Geocoding {len(todo)} uncached addresses (of {len(queries)} rows)")
+        for q in todo:
+            loc = geocode(q)
+            if loc is not None:
+                cache[q] = (loc.latitude, loc.longitude)
+        coords = [cache.get(q, (None, None)) for q in queries]
+
+    df["lat"] = [c[0] for c in coords]; df["lon"] = [c[1] for c in coords]
+    df[["lat", "lon"]] = df[["lat", "lon"]].astype(float)
+    mask = df["lat"].notna() & df["lon"].notna()
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["lon"], df["lat"]), crs=4326)
+    gdf.loc[~mask, "geometry"] = None
     out = Path(args.out); out.parent.mkdir(parents=True, exist_ok=True)
-    gdf.to_file(out, driver="GeoJSON")
+    # .geojsonl / .geojsons → newline-delimited features (streamable downstream)
+    driver = "GeoJSONSeq" if out.suffix.lower() in (".geojsonl", ".geojsons") else "GeoJSON"
+    gdf.to_file(out, driver=driver)
     print(f"Wrote {out}")
 
 if __name__ == "__main__":
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
-import argparse, re
+import argparse, re, hashlib, sys
 from pathlib import Path
 import pandas as pd
 import geopandas as gpd
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.normalize import percentiles
+
+CACHE_DIR = Path("data/cache")
+
 # Helpers
 def pick(df, *cands):
     cols = {c.lower(): c for c in df.columns}
@@ -21,21 +26,28 @@ def as_num(s):
     return pd.to_numeric(s, errors="coerce").replace([np.inf,-np.inf], np.nan)
 
 def norm01(series):
+    # clip to the 1st/99th percentiles, then scale to 0–1 (the clipped min/max are lo/hi)
     s = as_num(series)
-    lo, hi = np.nanpercentile(s, [1, 99])
-    s = s.clip(lo, hi)
-    return (s - s.min()) / (s.max() - s.min() + 1e-12)
-
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--excel", default="data/raw/hhi_2024_zcta.xlsx")
-    ap.add_argument("--xwalk", default="data/raw/zip_tract_xwalk.csv")
-    ap.add_argument("--tracts", default="data/processed/tracts_hvi.geojson")
-    ap.add_argument("--county_fips", default="06073", help="5-digit county FIPS (San Diego=06073)")
-    ap.add_argument("--out_csv", default="data/processed/hhi_tract.csv")
-    ap.add_argument("--out_geojson", default="data/processed/tracts_hvi_hhi.geojson")
-    args = ap.parse_args()
-
+    a = s.to_numpy(dtype=np.float64)
+    ok = ~np.isnan(a)
+    out = np.full(a.shape, np.nan)
+    if ok.any():
+        lo, hi = percentiles(a[ok], [1, 99])
+        x = np.clip(a[ok], lo, hi)
+        x -= lo
+        x /= (hi - lo + 1e-12)
+        out[ok] = x
+    return pd.Series(out, index=s.index, name=s.name)
+
+def cache_path(args):
+    """Cache file for the aggregated tract table, keyed on input paths/mtimes + county."""
+    key = (args.excel, Path(args.excel).stat().st_mtime,
+           args.xwalk, Path(args.xwalk).stat().st_mtime, args.county_fips)
+    digest = hashlib.md5(repr(key).encode()).hexdigest()[:16]
+    return CACHE_DIR / f"hhi_{digest}.parquet"
+
+def tract_hhi(args):
+    """ZCTA HHI (0–1) apportioned to tracts via the ZIP→tract crosswalk."""
     # Read HHI (ZCTA)
     print("[hhi] reading:", args.excel)
     df = pd.read_excel(args.excel, dtype=str)
@@ -73,16 +85,21 @@ def main():
     zcta_hhi = df[[zcol]].copy()
     zcta_hhi["CDC_HHI"] = hhi01.astype(float)
 
-    # Read crosswalk ZIP -> TRACT
+    # Read crosswalk ZIP -> TRACT (header first, then only the three columns we use)
     print("[hhi] reading ZIP-TRACT crosswalk:", args.xwalk)
-    xw = pd.read_csv(args.xwalk, dtype=str)
+    hdr = pd.read_csv(args.xwalk, dtype=str, nrows=0)
 
-    zip_c  = pick(xw, "zip", "zipcode", "zcta", "zcta5")
-    tr_c   = pick(xw, "tract", "tract_geoid", "geoid", "census_tract")
+    zip_c  = pick(hdr, "zip", "zipcode", "zcta", "zcta5")
+    tr_c   = pick(hdr, "tract", "tract_geoid", "geoid", "census_tract")
     # a weight column for apportioning (RES_RATIO or TOT_RATIO or RESIDENTIAL_RATIO etc.)
     try:
-        w_c = pick(xw, "res_ratio", "tot_ratio", "residential_ratio", "res_ratio_1")
+        w_c = pick(hdr, "res_ratio", "tot_ratio", "residential_ratio", "res_ratio_1")
     except KeyError:
+        w_c = None
+
+    usecols = [zip_c, tr_c] + ([w_c] if w_c else [])
+    xw = pd.read_csv(args.xwalk, usecols=usecols, dtype={zip_c: str, tr_c: str})
+    if w_c is None:
         # if none exist, use equal weights
         xw["__w__"] = 1.0
         w_c = "__w__"
@@ -102,6 +119,27 @@ def main():
     g = (m.groupby("TRACT", as_index=False)
            .agg(CDC_HHI=("w_hhi","sum"), W=("W","sum")))
     g["CDC_HHI"] = (g["CDC_HHI"] / (g["W"] + 1e-12)).fillna(0.0)
+    return g
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--excel", default="data/raw/hhi_2024_zcta.xlsx")
+    ap.add_argument("--xwalk", default="data/raw/zip_tract_xwalk.csv")
+    ap.add_argument("--tracts", default="data/processed/tracts_hvi.geojson")
+    ap.add_argument("--county_fips", default="06073", help="5-digit county FIPS (San Diego=06073)")
+    ap.add_argument("--out_csv", default="data/processed/hhi_tract.csv")
+    ap.add_argument("--out_geojson", default="data/processed/tracts_hvi_hhi.geojson")
+    args = ap.parse_args()
+
+    # Reuse the aggregated table when the inputs haven't changed
+    cached = cache_path(args)
+    if cached.exists():
+        print(f"[hhi] inputs unchanged → using cached tract table: {cached}")
+        g = pd.read_parquet(cached)
+    else:
+        g = tract_hhi(args)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        g.to_parquet(cached, index=False)
 
     out_csv = Path(args.out_csv)
     out_csv.parent.mkdir(parents=True, exist_ok=True)
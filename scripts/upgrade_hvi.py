@@ -1,30 +1,28 @@
 #!/usr/bin/env python3
+import sys
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 from pathlib import Path
 import shutil
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.normalize import zscore_matrix, minmax01_matrix
+
 IN_HVI  = Path("data/processed/tracts_hvi.geojson")    
 FEATS   = Path("data/processed/tract_features.parquet")  
 OUT_HVI = IN_HVI                                      
 
-def z(x):
-    x = pd.Series(x).astype(float)
-    return (x - x.mean()) / (x.std(ddof=0) + 1e-9)
-
 def minmax01(x):
-    x = pd.Series(x).astype(float)
-    lo, hi = np.nanpercentile(x, [1, 99])
-    x = x.clip(lo, hi)
-    return (x - x.min()) / (x.max() - x.min() + 1e-9)
+    x = pd.Series(x).astype(np.float32)
+    return pd.Series(minmax01_matrix(x.to_numpy()[:, None])[:, 0], index=x.index)
 
 def main():
     assert IN_HVI.exists(), f"Missing {IN_HVI}"
     g = gpd.read_file(IN_HVI)
 
     # Safe backup of the original file 
-    backup = IN_HVI.with_name(IN_HVI.stem + "_backup.geojson")
+    backup = IN_HVI.with_name(IN_HVI.stem + "_backup" + IN_HVI.suffix)
     shutil.copy(IN_HVI, backup)
     print(f"Backed up original HVI → {backup}")
 
@@ -56,22 +54,24 @@ def main():
     else:
         lst = lst.reindex(gi.index)
 
-    ndvi01     = minmax01(ndvi)
+    # NDVI and the existing HVI share one percentile-clip pass (columns of one array)
+    ndvi01, hvi_base01 = minmax01_matrix(
+        np.column_stack([ndvi.to_numpy(dtype=np.float32), gi["HVI"].to_numpy(dtype=np.float32)])).T
     inv_canopy = 1.0 - ndvi01
-    built_heat = z(lst) - z(ndvi01)     # hotter & barer → larger score
-    built01    = minmax01(built_heat)
+    zl, zn     = zscore_matrix(np.column_stack([lst.to_numpy(dtype=np.float32), ndvi01]), ddof=0).T
+    built_heat = zl - zn                # hotter & barer → larger score
+    built01    = minmax01_matrix(built_heat[:, None])[:, 0]
 
     # Blend with your existing HVI (keep existing HVI dominant)
-    hvi_base01 = minmax01(gi["HVI"])
     hvi2       = 0.60 * hvi_base01 + 0.20 * inv_canopy + 0.20 * built01
-    hvi2_01    = minmax01(hvi2)
+    hvi2_01    = minmax01(pd.Series(hvi2, index=gi.index))
 
     # Write back to the original (non-indexed) GeoDataFrame and save
     g["HVI"] = hvi2_01.reindex(g["GEOID"]).values
 
     # Ensure don't write an index column that collides with GEOID
     g = g.reset_index(drop=True)
-    g.to_file(OUT_HVI, driver="GeoJSON")
+    g.to_file(OUT_HVI)  # same format as the input (driver inferred from the suffix)
     print(f"Upgraded HVI written → {OUT_HVI}")
 
 if __name__ == "__main__":
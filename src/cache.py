@@ -0,0 +1,66 @@
+import hashlib
+import pickle
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+# On-disk cache shared by coverage.py and optimize.py, so re-runs while tuning
+# --k / --minutes skip the centroid reprojection and the walk-graph build.
+CACHE_DIR = Path("data/cache")
+
+
+def _centroid_cache_path(tracts_path) -> Path:
+    p = Path(tracts_path)
+    key = (str(p.resolve()), p.stat().st_mtime)
+    return CACHE_DIR / f"centroids_{hashlib.md5(repr(key).encode()).hexdigest()[:16]}.parquet"
+
+
+def load_tract_centroids(tracts_path, tracts: gpd.GeoDataFrame | None = None) -> pd.DataFrame:
+    """
+    Tract centroids (computed in EPSG:3857) as GEOID, x_3857, y_3857, x_4326, y_4326,
+    one row per tract in file order. Cached in data/cache keyed on path + mtime.
+    Pass the already-loaded tracts to avoid reading the file again on a miss;
+    if they are already in EPSG:3857 the centroid step skips reprojection.
+    """
+    cached = _centroid_cache_path(tracts_path)
+    if cached.exists():
+        df = pd.read_parquet(cached)
+        if tracts is None or len(df) == len(tracts):
+            return df
+
+    if tracts is None:
+        tracts = gpd.read_file(tracts_path)
+    c_m = tracts.geometry.to_crs(3857).centroid
+    c_ll = c_m.to_crs(4326)
+    df = pd.DataFrame({
+        "GEOID": tracts["GEOID"].astype(str).to_numpy(),
+        "x_3857": c_m.x.to_numpy(), "y_3857": c_m.y.to_numpy(),
+        "x_4326": c_ll.x.to_numpy(), "y_4326": c_ll.y.to_numpy(),
+    })
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(cached, index=False)
+    return df
+
+
+def centroid_points(df: pd.DataFrame, crs: int = 4326):
+    """Shapely points for cached centroids (3857 or 4326), built in one vectorized call."""
+    return shapely.points(df[f"x_{crs}"].to_numpy(), df[f"y_{crs}"].to_numpy())
+
+
+def load_walk_graph(aoi, build):
+    """
+    Walk graph for an AOI polygon, pickled in data/cache keyed on the AOI's WKB.
+    build(aoi) runs only on a miss (OSM download/parse + edge speeds/times).
+    """
+    key = hashlib.md5(shapely.to_wkb(aoi)).hexdigest()[:16]
+    cached = CACHE_DIR / f"graph_{key}.pkl"
+    if cached.exists():
+        with cached.open("rb") as f:
+            return pickle.load(f)
+    G = build(aoi)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    with cached.open("wb") as f:
+        pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return G
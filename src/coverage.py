@@ -6,8 +6,11 @@ import geopandas as gpd
 import pandas as pd
 import numpy as np
 import osmnx as ox
-import networkx as nx
-from shapely.geometry import Point, Polygon
+import shapely
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.cache import load_tract_centroids, centroid_points, load_walk_graph
+from src.isochrones import build_graph_from_aoi, isochrones
 
 # OSMnx settings: cache + logs (fast + visible progress)
 ox.settings.use_cache = True
@@ -16,34 +19,20 @@ ox.settings.log_level = logging.INFO
 ox.settings.timeout = 120
 
 
-def isochrone_polygon(G, center_node, minutes=15):
-    """
-    Build a walk-time isochrone polygon around a center node.
-    Uses travel_time in seconds on the graph, buffers in meters, returns WGS84 polygon.
-    """
-    cutoff = minutes * 60  # seconds
-    subgraph = nx.ego_graph(G, center_node, radius=cutoff, distance="travel_time")
-
-    # nodes GeoDataFrame in WGS84
-    nodes = ox.graph_to_gdfs(subgraph, edges=False)
-
-    # buffer IN METERS, then convert back to WGS84
-    nodes_m = nodes.to_crs(3857)              # Web Mercator (meters)
-    poly_m  = nodes_m.buffer(35).union_all()  # replaces deprecated .unary_union
-    poly    = gpd.GeoSeries([poly_m], crs=3857).to_crs(4326).iloc[0]
-    return poly
-
-
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--tracts", required=True, help="GeoJSON/GPKG with HVI (must have GEOID, HVI)")
     ap.add_argument("--sites", required=True, help="Cooling sites GeoJSON (EPSG:4326)")
     ap.add_argument("--minutes", type=int, default=15)
     ap.add_argument("--out", default="data/processed/coverage.gpkg")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Processes for isochrones (default: all cores; 1 = serial)")
     args = ap.parse_args()
 
-    # Load inputs and normalize CRS to WGS84
+    # Load inputs and normalize CRS to WGS84; tracts are also projected ONCE to meters
+    # (AOI clip + centroids share it)
     tracts = gpd.read_file(args.tracts)
+    tracts_m = tracts.to_crs(3857)
     tracts = tracts.to_crs(4326)
 
     sites = gpd.read_file(args.sites)
@@ -57,49 +46,53 @@ def main():
 
     # Build a SMALL AOI around actual sites (much faster than whole county)
     sites_m  = sites.to_crs(3857)
-    tracts_m = tracts.to_crs(3857)
 
     walk_m_per_min = 80  # ~4.8 km/h
     clip_radius = (args.minutes * walk_m_per_min) * 2  # generous area around sites
 
     # Buffer sites, intersect with dissolved tracts to keep within study area
     clip_m = sites_m.buffer(clip_radius).union_all().intersection(
-        tracts_m.dissolve().geometry.iloc[0]
+        tracts_m.union_all()
     )
     clip = gpd.GeoSeries([clip_m], crs=3857).to_crs(4326).iloc[0]
 
-    # Pull walk network just for this clipped AOI (osmnx 2.x)
-    G = ox.graph_from_polygon(clip, network_type="walk", retain_all=False)
-    G = ox.add_edge_speeds(G)
-    G = ox.add_edge_travel_times(G)
+    # Pull walk network just for this clipped AOI (osmnx 2.x; pickled per AOI in data/cache)
+    G = load_walk_graph(clip, build_graph_from_aoi)
 
-    # Build isochrones for each site
+    # Build isochrones for each site: nearest nodes in one call, isochrones across processes
+    xs, ys = sites.geometry.x.to_numpy(), sites.geometry.y.to_numpy()
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    for i in np.flatnonzero(~valid):
+        print(f"Skipping site {i + 1}/{len(sites)}: missing or non-finite geometry", file=sys.stderr)
+    nodes = ox.nearest_nodes(G, xs[valid], ys[valid])
     polys = []
-    for _, row in sites.iterrows():
-        try:
-            node = ox.nearest_nodes(G, float(row.geometry.x), float(row.geometry.y))
-            poly = isochrone_polygon(G, node, minutes=args.minutes)
+    for _, poly, err in isochrones(G, nodes, args.minutes, args.workers):
+        if poly is None:
+            print(f"Skipping site due to error: {err}", file=sys.stderr)
+        else:
             polys.append(poly)
-        except Exception as e:
-            print(f"Skipping site due to error: {e}", file=sys.stderr)
 
     if not polys:
         raise SystemExit("No coverage polygons were produced. Check your sites geometry.")
 
-    cover = gpd.GeoSeries(polys, crs=4326)
-    coverage_union = cover.union_all()  # replaces deprecated .unary_union
+    # Flag tracts by centroid coverage: a centroid is covered if it lies within ANY isochrone,
+    # answered by one STRtree query (no test against the union). The prepared isochrones are
+    # the query side and the centroids the tree, so each polygon's edge index is built once
+    # and reused for every candidate point.
+    # (centroids computed in a projected CRS to avoid geodetic centroid quirks; cached across runs)
+    tr_cent = load_tract_centroids(args.tracts, tracts_m)
+    polys_arr = np.asarray(polys, dtype=object)
+    shapely.prepare(polys_arr)
+    tree = shapely.STRtree(centroid_points(tr_cent, 4326))
+    _, cent_i = tree.query(polys_arr, predicate="contains")
+    covered = np.zeros(len(tr_cent), dtype=bool)
+    covered[cent_i] = True
+    tracts_with_cov = tracts.assign(covered=covered)  # same row order as the tracts file
+
+    # The dissolved footprint is only needed for the output layer
+    coverage_union = shapely.union_all(polys_arr)
     coverage_gdf = gpd.GeoDataFrame(geometry=[coverage_union], crs=4326)
 
-    # Flag tracts by centroid coverage
-    # (centroids computed in a projected CRS to avoid geodetic centroid quirks)
-    tr_m = tracts.to_crs(3857).copy()
-    tr_m["centroid"] = tr_m.geometry.centroid
-    tr_cent = tr_m[["GEOID", "centroid"]].copy().set_geometry("centroid").to_crs(4326)
-    tr_cent["covered"] = tr_cent.geometry.within(coverage_union)
-
-    tracts_with_cov = tracts.merge(tr_cent[["GEOID", "covered"]], on="GEOID", how="left")
-    tracts_with_cov["covered"] = tracts_with_cov["covered"].fillna(False)
-
     # Write outputs
     out = Path(args.out)
     out.parent.mkdir(parents=True, exist_ok=True)
@@ -107,6 +100,28 @@ def main():
     tracts_with_cov.to_file(out, layer="tracts_with_coverage", driver="GPKG")
     print(f"Wrote {out} with layers: coverage, tracts_with_coverage")
 
+    # Summary scalars + top uncovered tracts next to the GPKG (the app reads these, not the layers)
+    covered = tracts_with_cov["covered"].astype(bool)
+    summary = {"pct_tracts_covered": 100.0 * covered.mean()}
+    if "population" in tracts_with_cov.columns:
+        pop = pd.to_numeric(tracts_with_cov["population"], errors="coerce").fillna(0.0)
+        summary["pct_pop_covered"] = 100.0 * pop[covered].sum() / (pop.sum() + 1e-9)
+    if "HVI" in tracts_with_cov.columns:
+        hvi = pd.to_numeric(tracts_with_cov["HVI"], errors="coerce")
+        w = hvi.clip(0, 1)
+        summary["hvi_weighted_pct"] = 100.0 * (covered * w).sum() / (w.sum() + 1e-9)
+
+        top = (tracts_with_cov.loc[~covered, ["GEOID"]].assign(HVI=hvi[~covered])
+                              .sort_values("HVI", ascending=False)
+                              .head(10))
+        top_csv = out.with_name(out.stem + "_top_uncovered.csv")
+        top.to_csv(top_csv, index=False)
+        print(f"Wrote {top_csv}")
+
+    summary_csv = out.with_name(out.stem + "_summary.csv")
+    pd.DataFrame([summary]).to_csv(summary_csv, index=False)
+    print(f"Wrote {summary_csv}")
+
 
 if __name__ == "__main__":
     main()
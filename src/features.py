@@ -1,12 +1,69 @@
 #!/usr/bin/env python3
-import argparse
+import argparse, math, sys
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-import rioxarray as rxr
-from rasterstats import zonal_stats
+import rasterio
+from rasterio.features import rasterize
+from rasterio.errors import WindowError
+from rasterio.windows import Window, from_bounds
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.normalize import percentiles as partition_percentiles
+
+# Zonal stats by rasterizing all tracts once into a label grid (pixel centers, like
+# rasterstats' default) and reducing pixel values per label, instead of masking
+# the raster once per polygon.
+
+def zone_labels(geoms, shape, transform):
+    """Label grid: 1-based tract index per pixel, 0 outside every tract."""
+    shapes = ((geom, i) for i, geom in enumerate(geoms, 1) if geom is not None and not geom.is_empty)
+    return rasterize(shapes, out_shape=shape, transform=transform, fill=0, dtype="int32")
+
+def zonal_reduce(values, labels, n, percentiles=()):
+    """
+    Per-zone mean and percentiles (linear, as np.percentile) over non-NaN pixels.
+    Returns {"mean": array(n), q: array(n), ...}; zones without pixels are NaN.
+    """
+    lab = labels.ravel()
+    v = np.asarray(values, dtype=float).ravel()
+    keep = (lab > 0) & ~np.isnan(v)
+    lab, v = lab[keep] - 1, v[keep]
+
+    counts = np.bincount(lab, minlength=n)
+    sums = np.bincount(lab, weights=v, minlength=n)
+    out = {"mean": np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)}
+    if percentiles:
+        # group pixels by zone once, then an O(n) partition per non-empty zone slice
+        v = v[np.argsort(lab, kind="stable")]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        res = np.full((len(percentiles), n), np.nan)
+        for i in np.flatnonzero(counts):
+            res[:, i] = partition_percentiles(v[starts[i]:starts[i] + counts[i]], percentiles)
+        out.update(zip(percentiles, res))
+    return out
+
+def read_tract_window(path, tracts):
+    """
+    Band 1 of a raster, read only over the tracts' bounding box (whole pixels).
+    Returns (array, window transform, raster CRS, tracts in that CRS); array and
+    transform are None when the raster doesn't overlap the tracts at all.
+    """
+    with rasterio.open(path) as src:
+        t = tracts if tracts.crs == src.crs else tracts.to_crs(src.crs)
+        w = from_bounds(*t.total_bounds, transform=src.transform)
+        col0, row0 = math.floor(w.col_off), math.floor(w.row_off)
+        win = Window(col0, row0,
+                     math.ceil(w.col_off + w.width) - col0,
+                     math.ceil(w.row_off + w.height) - row0)
+        try:
+            win = win.intersection(Window(0, 0, src.width, src.height))
+        except WindowError:
+            print(f"[features] {path} does not overlap the tracts; its stats are NaN", file=sys.stderr)
+            return None, None, src.crs, t
+        return src.read(1, window=win), src.window_transform(win), src.crs, t
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--tracts", required=True, help="GPKG/GeoJSON of tracts (must have GEOID)")
@@ -16,25 +73,28 @@ def main():
     args = ap.parse_args()
 
     tracts = gpd.read_file(args.tracts)
-    lst = rxr.open_rasterio(args.lst).squeeze()
-    if tracts.crs != lst.rio.crs:
-        tracts = tracts.to_crs(lst.rio.crs)
+    # rasters are read only over the tract bbox, not the whole scene
+    lst, lst_aff, lst_crs, tracts = read_tract_window(args.lst, tracts)
 
-    stats = zonal_stats(tracts, lst.values, affine=lst.rio.transform(),
-                        stats=['mean','percentile_95'], nodata=None)
-    df = pd.DataFrame(stats).rename(columns={"mean":"LST_mean","percentile_95":"LST_p95"})
+    n = len(tracts)
+    labels = None
+    if lst is not None:
+        labels = zone_labels(tracts.geometry, lst.shape, lst_aff)
+        stats = zonal_reduce(lst, labels, n, percentiles=(95,))
+        df = pd.DataFrame({"LST_mean": stats["mean"], "LST_p95": stats[95]})
+    else:
+        df = pd.DataFrame({"LST_mean": np.full(n, np.nan), "LST_p95": np.full(n, np.nan)})
 
+    df["NDVI_med"] = np.nan
     if args.ndvi:
-        ndvi = rxr.open_rasterio(args.ndvi).squeeze()
-        if tracts.crs != ndvi.rio.crs:
-            tracts_ndvi = tracts.to_crs(ndvi.rio.crs)
-        else:
-            tracts_ndvi = tracts
-        ndvi_stats = zonal_stats(tracts_ndvi, ndvi.values, affine=ndvi.rio.transform(),
-                                 stats=['median'], nodata=None)
-        df["NDVI_med"] = pd.DataFrame(ndvi_stats)["median"]
-    else:
-        df["NDVI_med"] = np.nan
+        ndvi, ndvi_aff, ndvi_crs, tracts_ndvi = read_tract_window(args.ndvi, tracts)
+        if ndvi is not None:
+            same_grid = (labels is not None and ndvi_crs == lst_crs
+                         and ndvi.shape == lst.shape and ndvi_aff == lst_aff)
+            if not same_grid:
+                # different grid → rasterize again
+                labels = zone_labels(tracts_ndvi.geometry, ndvi.shape, ndvi_aff)
+            df["NDVI_med"] = zonal_reduce(ndvi, labels, n, percentiles=(50,))[50]
 
     out = pd.concat([tracts[["GEOID"]].reset_index(drop=True), df], axis=1)
     Path(args.out).parent.mkdir(parents=True, exist_ok=True)
@@ -1,18 +1,19 @@
 #!/usr/bin/env python3
-import argparse
+import argparse, sys
 import pandas as pd
 import geopandas as gpd
 import numpy as np
 from pathlib import Path
 
-def zscore(s):
-    return (s - s.mean()) / (s.std() + 1e-9)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.normalize import zscore_matrix
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--features", required=True, help="Parquet from src.features")
     ap.add_argument("--acs", required=True, help="Parquet from fetch_acs.py")
-    ap.add_argument("--out", required=True, help="GeoJSON of tracts with HVI")
+    ap.add_argument("--out", required=True,
+                    help="Tracts with HVI; format from suffix (.fgb = FlatGeobuf, .geojson, .gpkg)")
     ap.add_argument("--tracts_geom", required=True, help="Tracts geometry file (e.g., tracts_sd.gpkg)")
     args = ap.parse_args()
 
@@ -25,10 +26,10 @@ def main():
     sen_cols = ["pct_age65p","no_vehicle","limited_english"]
     cap_cols = ["renters_pct","crowding_pct","income_median_neg"]
 
-    Xexp = df[exp_cols].apply(zscore)
-    Xsen = df[sen_cols].apply(zscore)
-    Xcap = df[cap_cols].apply(zscore)
-    HVI = 0.4*Xexp.mean(1) + 0.4*Xsen.mean(1) + 0.2*Xcap.mean(1)
+    # z-score all nine indicators in one array op, then average per domain
+    cols = exp_cols + sen_cols + cap_cols
+    Z = pd.DataFrame(zscore_matrix(df[cols].to_numpy(dtype=np.float32)), columns=cols, index=df.index)
+    HVI = 0.4*Z[exp_cols].mean(1) + 0.4*Z[sen_cols].mean(1) + 0.2*Z[cap_cols].mean(1)
     df["HVI"] = (HVI - HVI.min())/(HVI.max()-HVI.min() + 1e-9)
 
     g = gpd.read_file(args.tracts_geom)
@@ -37,7 +38,7 @@ def main():
     gdf = gdf.set_crs(g.crs)
 
     Path(args.out).parent.mkdir(parents=True, exist_ok=True)
-    gdf.to_file(args.out, driver="GeoJSON")
+    gdf.to_file(args.out)  # driver inferred from the suffix
     print(f"Wrote {args.out}")
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import osmnx as ox
+import shapely
+from pyproj import Transformer
+from shapely.ops import transform
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+
+# Walk-time isochrones shared by coverage.py and optimize.py.
+# The walk graph is flattened once into a CSR travel-time matrix + node coordinate
+# arrays; each isochrone is then a bounded scipy Dijkstra from the site's node.
+
+# Built once per process: reprojecting the buffered polygon back to WGS84 then
+# skips the GeoSeries + CRS lookup it used to cost per site.
+_TO_4326 = Transformer.from_crs(3857, 4326, always_xy=True).transform
+
+
+def build_graph_from_aoi(aoi):
+    """OSMnx 2.x: build walk graph from polygon AOI."""
+    G = ox.graph_from_polygon(aoi, network_type="walk", retain_all=False)
+    G = ox.add_edge_speeds(G)
+    G = ox.add_edge_travel_times(G)
+    return G
+
+
+def graph_arrays(G):
+    """
+    (csr, node_x, node_y, pos) for an OSMnx graph with edge travel_time (seconds).
+    csr[i, j] = fastest parallel edge i→j; node_x/node_y are EPSG:3857 meters in
+    G.nodes order (projected once here, not per isochrone); pos maps node id → row.
+    """
+    nodes = list(G.nodes)
+    pos = {n: i for i, n in enumerate(nodes)}
+    lon = np.fromiter((G.nodes[n]["x"] for n in nodes), dtype=float, count=len(nodes))
+    lat = np.fromiter((G.nodes[n]["y"] for n in nodes), dtype=float, count=len(nodes))
+    to_m = Transformer.from_crs(G.graph.get("crs", 4326), 3857, always_xy=True)
+    node_x, node_y = to_m.transform(lon, lat)
+
+    e = np.array([(pos[u], pos[v], d.get("travel_time", np.inf))
+                  for u, v, d in G.edges(data=True)], dtype=float).reshape(-1, 3)
+    e = e[np.isfinite(e[:, 2])]
+    u, v, t = e[:, 0].astype(np.int64), e[:, 1].astype(np.int64), e[:, 2]
+    # keep the fastest of any parallel edges (csr_matrix would sum duplicates)
+    order = np.lexsort((t, v, u))
+    u, v, t = u[order], v[order], t[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+    # sparse graphs treat explicit zeros as missing edges, so floor travel times
+    csr = sparse.csr_matrix((np.maximum(t[first], 1e-6), (u[first], v[first])),
+                            shape=(len(nodes), len(nodes)))
+    return csr, node_x, node_y, pos
+
+
+def isochrone_polygon(csr, node_x, node_y, source, minutes=15):
+    """
+    Build a walk-time isochrone polygon around node row `source`.
+    Uses travel_time in seconds on the graph, buffers in meters, returns WGS84 polygon.
+    """
+    cutoff = minutes * 60  # seconds
+    dist = dijkstra(csr, indices=source, limit=cutoff)
+    reach = dist <= cutoff
+
+    # reachable nodes, already in Web Mercator (meters): buffer + union as array ops
+    nodes_m = shapely.points(node_x[reach], node_y[reach])
+    poly_m  = shapely.union_all(shapely.buffer(nodes_m, 35))
+
+    # convert back to WGS84
+    poly    = transform(_TO_4326, poly_m)
+    return poly
+
+
+# Worker-side graph arrays, set once per process by the pool initializer so they
+# are pickled once per worker rather than once per site.
+_GRAPH = None
+
+def _init_worker(csr, node_x, node_y):
+    global _GRAPH
+    _GRAPH = (csr, node_x, node_y)
+
+def _iso_task(task):
+    i, source, minutes = task
+    try:
+        return i, isochrone_polygon(*_GRAPH, source, minutes=minutes), None
+    except Exception as e:
+        return i, None, str(e)
+
+
+def _run_tasks(tasks, graph, workers):
+    if workers == 1 or len(tasks) < 2:
+        _init_worker(*graph)
+        yield from map(_iso_task, tasks)
+        return
+    workers = min(workers, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=graph) as ex:
+        yield from ex.map(_iso_task, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+
+
+def isochrones(G, nodes, minutes=15, workers=None):
+    """
+    Isochrone per center node id (e.g. from one vectorized ox.nearest_nodes call),
+    yielded in input order as (i, polygon, error); polygon is None (and error set)
+    when a site fails. Sites snapping to the same node share one computation.
+    Runs on `workers` processes (default: all cores); workers=1 stays in this process.
+    """
+    csr, node_x, node_y, pos = graph_arrays(G)
+    sources = [pos[node] for node in nodes]
+    uniq = list(dict.fromkeys(sources))  # distinct nodes, in first-seen order
+    slot = {src: j for j, src in enumerate(uniq)}
+    tasks = [(j, src, minutes) for j, src in enumerate(uniq)]
+
+    # results arrive in task order; emit each input as soon as its node's result is in
+    done, i = [], 0
+    for _, poly, err in _run_tasks(tasks, (csr, node_x, node_y), workers or os.cpu_count() or 1):
+        done.append((poly, err))
+        while i < len(sources) and slot[sources[i]] < len(done):
+            yield (i, *done[slot[sources[i]]])
+            i += 1
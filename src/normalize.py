@@ -0,0 +1,32 @@
+import numpy as np
+
+# Column-wise normalizers shared by hvi.py, risk.py and scripts/upgrade_hvi.py,
+# plus a partition-based percentile used by features.py and scripts/ingest_hhi.py.
+# Each takes a 2-D array (rows = tracts, columns = variables) and normalizes
+# every column in one pass; NaNs are ignored in the statistics and stay NaN.
+# Work is float32 by default: these are index-scale values, and half-width
+# arrays halve the memory traffic of the (memory-bound) reductions.
+
+
+def zscore_matrix(X, ddof=1, dtype=np.float32):
+    """Column z-scores. ddof=1 matches pandas .std(); pass ddof=0 for population std."""
+    X = np.asarray(X, dtype=dtype)
+    return (X - np.nanmean(X, axis=0)) / (np.nanstd(X, axis=0, ddof=ddof) + 1e-9)
+
+
+def minmax01_matrix(X, q=(1, 99), dtype=np.float32):
+    """Clip each column to its q-th percentiles, then scale to 0–1."""
+    X = np.asarray(X, dtype=dtype)
+    lo, hi = np.nanpercentile(X, q, axis=0)
+    return (np.clip(X, lo, hi) - lo) / (hi - lo + 1e-9)
+
+
+def percentiles(a, qs):
+    """
+    Linear-interpolated percentiles (same as np.percentile) of a NaN-free 1-D
+    array via np.partition: O(N) selection of the bracketing values, no full sort.
+    """
+    pos = np.asarray(qs, dtype=float) / 100.0 * (a.size - 1)
+    lo_i, hi_i = np.floor(pos).astype(int), np.ceil(pos).astype(int)
+    part = np.partition(a, np.unique(np.r_[lo_i, hi_i]))
+    return part[lo_i] + (part[hi_i] - part[lo_i]) * (pos - lo_i)
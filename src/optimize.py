@@ -5,8 +5,19 @@ from pathlib import Path
 import pandas as pd
 import geopandas as gpd
 import numpy as np
+import shapely
 import osmnx as ox
-import networkx as nx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.cache import load_tract_centroids, centroid_points, load_walk_graph
+from src.isochrones import build_graph_from_aoi, isochrones
+from src.paths import resolve_risk_path
+
+# Optional: numba JIT for the greedy loop (falls back to the bit-packed NumPy version)
+try:
+    from numba import njit, prange
+except Exception:
+    njit = None
 
 # OSMnx settings 
 ox.settings.use_cache = True
@@ -16,29 +27,10 @@ ox.settings.timeout = 120
 
 
 # Helpers 
-def isochrone_polygon(G, center_node, minutes=15):
-    """Walk-time isochrone polygon (minutes). Buffers in meters, returns WGS84."""
-    cutoff = minutes * 60  # seconds
-    subgraph = nx.ego_graph(G, center_node, radius=cutoff, distance="travel_time")
-    nodes = ox.graph_to_gdfs(subgraph, edges=False)
-    nodes_m = nodes.to_crs(3857)
-    poly_m = nodes_m.buffer(35).union_all()  # replaces deprecated unary_union
-    poly = gpd.GeoSeries([poly_m], crs=3857).to_crs(4326).iloc[0]
-    return poly
-
-
-def build_graph_from_aoi(aoi):
-    """OSMnx 2.x: build walk graph from polygon AOI."""
-    G = ox.graph_from_polygon(aoi, network_type="walk", retain_all=False)
-    G = ox.add_edge_speeds(G)
-    G = ox.add_edge_travel_times(G)
-    return G
-
-
 def build_weights(
     tracts_gdf: gpd.GeoDataFrame,
     weight_by: str = "hvi",
-    risk_path: Path = Path("data/processed/tracts_risk.geojson"),
+    risk_path: Path | None = None,
     equity_csv: str | None = None,
     equity_weight: float = 1.0,
 ) -> pd.Series:
@@ -47,30 +39,39 @@ def build_weights(
 
     weight_by: "hvi" (default) or "risk". If "risk" and the risk file exists,
                uses RISK (0–1) and falls back to HVI where missing.
+    risk_path: risk layer; default .fgb, or the legacy .geojson if only that exists.
     equity_csv: optional CSV with columns GEOID, ej (0/1). When provided,
                 multiplies weight in EJ tracts by equity_weight (e.g., 1.5).
     """
     if "GEOID" not in tracts_gdf.columns:
         raise ValueError("Tracts dataframe must contain a 'GEOID' column")
 
-    idx = tracts_gdf["GEOID"].astype(str)
+    idx = pd.Index(tracts_gdf["GEOID"].astype(str))
+
+    def gather(geoids, values, default):
+        """values (keyed by geoids) in tract order via one integer lookup; default where absent."""
+        pos = pd.Index(geoids.astype(str)).get_indexer(idx)  # -1 where absent → the appended default
+        return np.append(np.asarray(values, dtype=np.float32), np.float32(default))[pos]
+
     # Base = HVI in 0–1 if present; otherwise 1.0 as a neutral baseline
     if "HVI" in tracts_gdf.columns:
-        base = pd.Series(tracts_gdf["HVI"].astype(float).values, index=idx)
+        base = tracts_gdf["HVI"].to_numpy(dtype=np.float32)
     else:
-        base = pd.Series(1.0, index=idx)
+        base = np.ones(len(idx), dtype=np.float32)
 
+    risk_path = Path(risk_path) if risk_path is not None else resolve_risk_path()
     if str(weight_by).lower().startswith("risk") and risk_path.exists():
         try:
-            r = gpd.read_file(risk_path)[["GEOID", "RISK"]].set_index("GEOID")["RISK"].astype(float)
-            base = r.reindex(idx).fillna(base)
+            r = gpd.read_file(risk_path, ignore_geometry=True)[["GEOID", "RISK"]]
+            risk = gather(r["GEOID"], r["RISK"].astype(float), np.nan)
+            base = np.where(np.isnan(risk), base, risk)
             print("[opt] using risk-weighted objective (RISK 0–1, fallback = HVI)")
         except Exception as e:
             print(f"[opt] risk file unreadable, falling back to HVI: {e}", file=sys.stderr)
     else:
         print("[opt] using HVI-weighted objective")
 
-    w = base.clip(0, 1)
+    w = np.clip(base, 0, 1)
 
     # Optional equity bump
     if equity_csv:
@@ -79,9 +80,8 @@ def build_weights(
             try:
                 ej = pd.read_csv(p, dtype={"GEOID": str})
                 if "ej" in ej.columns:
-                    ej = ej.set_index("GEOID")["ej"].fillna(0).astype(float)
-                    bump = 1.0 + (float(equity_weight) - 1.0) * ej.reindex(idx).fillna(0.0)
-                    w = (w * bump).astype(float)
+                    ej_w = gather(ej["GEOID"], ej["ej"].fillna(0).astype(float), 0.0)
+                    w = w * (1.0 + (float(equity_weight) - 1.0) * ej_w)
                     print(f"[opt] equity bump enabled: x{equity_weight} in EJ tracts from {p}")
                 else:
                     print(f"[opt] equity CSV missing 'ej' column → ignored: {p}", file=sys.stderr)
@@ -90,7 +90,74 @@ def build_weights(
         else:
             print(f"[opt] equity CSV not found → ignored: {p}", file=sys.stderr)
 
-    return w.fillna(0.0)
+    return pd.Series(np.where(np.isnan(w), 0.0, w), index=idx)
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _greedy_nb(cover, w, k):
+        """Compiled greedy: per step, candidate gains in parallel, no temporaries."""
+        n_cand, n_tr = cover.shape
+        remaining = np.ones(n_tr, dtype=np.bool_)
+        taken = np.zeros(n_cand, dtype=np.bool_)
+        gains = np.empty(n_cand)
+        chosen = np.empty(k, dtype=np.int64)
+        gained = np.empty(k)
+        for step in range(k):
+            for i in prange(n_cand):
+                s = -1.0  # avoid picking same site twice
+                if not taken[i]:
+                    s = 0.0
+                    for t in range(n_tr):
+                        if cover[i, t] and remaining[t]:
+                            s += w[t]
+                gains[i] = s
+            j = np.argmax(gains)
+            chosen[step] = j
+            gained[step] = gains[j]
+            taken[j] = True
+            for t in range(n_tr):
+                if cover[j, t]:
+                    remaining[t] = False
+        return chosen, gained
+else:
+    _greedy_nb = None
+
+
+def greedy_max_coverage(covered_by: np.ndarray, weights: np.ndarray, k: int):
+    """
+    Greedy weighted max-coverage over a [candidates, tracts] boolean matrix.
+    Yields (candidate index, weight newly covered) for each of k picks.
+
+    With numba installed this runs as a compiled kernel (_greedy_nb). Otherwise
+    coverage is bit-packed (8 tracts per byte) and each byte column gets a
+    256-entry table of "weight of the tracts whose bits are set", so a gain is
+    a table lookup per byte instead of 8 float multiplies.
+    """
+    n_cand, n_tr = covered_by.shape
+    if _greedy_nb is not None:
+        chosen, gained = _greedy_nb(np.ascontiguousarray(covered_by, dtype=np.bool_),
+                                    np.asarray(weights, dtype=np.float64), min(k, n_cand))
+        yield from zip(chosen.tolist(), gained.tolist())
+        return
+
+    bits = np.packbits(covered_by, axis=1)                     # [candidates, bytes]
+    n_bytes = bits.shape[1]
+    w8 = np.zeros(n_bytes * 8)
+    w8[:n_tr] = weights
+    byte_bits = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)  # [256, 8], MSB first
+    lut = w8.reshape(n_bytes, 8) @ byte_bits.T                 # [bytes, 256]
+    cols = np.arange(n_bytes)
+
+    remaining = np.full(n_bytes, 0xFF, dtype=np.uint8)
+    taken = np.zeros(n_cand, dtype=bool)
+    for _ in range(min(k, n_cand)):
+        gains = lut[cols, bits & remaining].sum(axis=1)
+        gains[taken] = -1.0  # avoid picking same site twice
+        j = int(np.argmax(gains))
+        taken[j] = True
+        remaining &= ~bits[j]
+        yield j, float(gains[j])
 
 
 # Main 
@@ -101,6 +168,8 @@ def main():
     ap.add_argument("--k", type=int, required=True, help="How many sites to select")
     ap.add_argument("--minutes", type=int, default=15, help="Walk minutes for isochrone")
     ap.add_argument("--out", required=True, help="Output GeoJSON for selected sites")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Processes for isochrones (default: all cores; 1 = serial)")
 
     # NEW: objective weighting & equity options
     ap.add_argument("--weight_by", choices=["hvi", "risk"], default="hvi",
@@ -112,7 +181,8 @@ def main():
 
     args = ap.parse_args()
 
-    tracts = gpd.read_file(args.tracts).to_crs(4326)
+    # Tracts are projected once; only their attributes, the AOI clip and centroids are used here
+    tracts_m = gpd.read_file(args.tracts).to_crs(3857)
     sites = gpd.read_file(args.sites)
     if sites.crs is None:
         sites.set_crs(4326, inplace=True)
@@ -126,68 +196,62 @@ def main():
 
     # Small AOI around candidates (MUCH faster than whole county)
     sites_m = sites.to_crs(3857)
-    tracts_m = tracts.to_crs(3857)
     walk_m_per_min = 80
     clip_radius = (args.minutes * walk_m_per_min) * 2  # generous
     clip_m = sites_m.buffer(clip_radius).union_all().intersection(
-        tracts_m.dissolve().geometry.iloc[0]
+        tracts_m.union_all()
     )
     aoi = gpd.GeoSeries([clip_m], crs=3857).to_crs(4326).iloc[0]
 
     print("[opt] building walk graph for AOI…")
-    G = build_graph_from_aoi(aoi)
+    G = load_walk_graph(aoi, build_graph_from_aoi)  # pickled per AOI in data/cache
     print("[opt] graph ready")
 
-    # Precompute isochrones per candidate
-    polys = []
-    for i, (_, r) in enumerate(sites.iterrows(), 1):
-        try:
-            node = ox.nearest_nodes(G, float(r.geometry.x), float(r.geometry.y))
-            poly = isochrone_polygon(G, node, minutes=args.minutes)
+    # Precompute isochrones per candidate: nearest nodes in one call, isochrones across processes
+    xs, ys = sites.geometry.x.to_numpy(), sites.geometry.y.to_numpy()
+    valid = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+    nodes = ox.nearest_nodes(G, xs[valid], ys[valid])
+    polys, cand_idx = [], []  # cand_idx[j] = row in `sites` for isochrone j
+    for done, (i, poly, err) in enumerate(isochrones(G, nodes, args.minutes, args.workers), 1):
+        if poly is None:
+            print(f"[opt] skip site {valid[i] + 1}/{len(sites)}: {err}", file=sys.stderr)
+        else:
             polys.append(poly)
-            if i % 5 == 0 or i == len(sites):
-                print(f"[opt] isochrones: {i}/{len(sites)}")
-        except Exception as e:
-            print(f"[opt] skip site {i}/{len(sites)}: {e}", file=sys.stderr)
+            cand_idx.append(int(valid[i]))
+        if done % 5 == 0 or done == len(valid):
+            print(f"[opt] isochrones: {done}/{len(valid)}")
 
     if not polys:
         raise SystemExit("No isochrones were created.")
 
-    # Prepare tract centroids + weights
-    tr_m = tracts.to_crs(3857).copy()
-    tr_m["centroid"] = tr_m.geometry.centroid
-    cent = tr_m[["GEOID", "centroid"]].copy().set_geometry("centroid").to_crs(4326)
-    cent["GEOID"] = cent["GEOID"].astype(str)
+    # Prepare tract centroids (cached across runs) + weights
+    cent = load_tract_centroids(args.tracts, tracts_m)
 
     weights_series = build_weights(
-        tracts_gdf=tracts,
+        tracts_gdf=tracts_m,
         weight_by=args.weight_by,
-        risk_path=Path("data/processed/tracts_risk.geojson"),
+        risk_path=resolve_risk_path(),
         equity_csv=args.equity_csv,
         equity_weight=args.equity_weight,
     )
     # align weights to centroid order
-    cent["weight"] = weights_series.reindex(cent["GEOID"]).fillna(0.0).values
+    weights = weights_series.reindex(cent["GEOID"]).fillna(0.0).to_numpy()
 
     # For each candidate, which centroids are inside its isochrone?
-    covered_by = []
-    for j, poly in enumerate(polys):
-        covered_by.append(cent.geometry.within(poly).values)
-    covered_by = np.vstack(covered_by)  # shape: [num_candidates, num_centroids]
-    weights = cent["weight"].to_numpy()
+    # One bulk STRtree query: bbox prefilter + GEOS "contains" in C, as (poly, centroid) index pairs.
+    # Isochrones are prepared once up front, so each point-in-polygon test uses their edge index.
+    polys_arr = np.asarray(polys, dtype=object)
+    shapely.prepare(polys_arr)
+    tree = shapely.STRtree(centroid_points(cent, 4326))
+    poly_i, cent_i = tree.query(polys_arr, predicate="contains")
+    covered_by = np.zeros((len(polys), len(cent)), dtype=bool)  # [num_candidates, num_centroids]
+    covered_by[poly_i, cent_i] = True
 
     # Greedy selection: pick k sites maximizing weighted coverage
     chosen = []
-    remaining = np.ones(len(cent), dtype=bool)
-    for _ in range(min(args.k, len(sites))):
-        gains = (covered_by[:, remaining] * weights[remaining]).sum(axis=1)
-        if chosen:
-            gains[chosen] = -1.0  # avoid picking same site twice
-        j = int(np.argmax(gains))
-        chosen.append(j)
-        newly = covered_by[j] & remaining
-        remaining[newly] = False
-        print(f"[opt] pick #{len(chosen)} -> candidate {j} (+{weights[newly].sum():.2f} weight)")
+    for j, gain in greedy_max_coverage(covered_by, weights, min(args.k, len(sites))):
+        chosen.append(cand_idx[j])
+        print(f"[opt] pick #{len(chosen)} -> candidate {cand_idx[j]} (+{gain:.2f} weight)")
 
     # Save
     out = Path(args.out)
@@ -0,0 +1,14 @@
+from pathlib import Path
+
+# Output locations read by more than one consumer (optimize.py,
+# scripts/finalize_tracts.py, the Streamlit app).
+
+RISK_FGB     = Path("data/processed/tracts_risk.fgb")
+RISK_GEOJSON = Path("data/processed/tracts_risk.geojson")  # written by older src/risk.py runs
+
+
+def resolve_risk_path() -> Path:
+    """The tract risk layer: FlatGeobuf if present, else the legacy GeoJSON (FlatGeobuf if neither exists)."""
+    if not RISK_FGB.exists() and RISK_GEOJSON.exists():
+        return RISK_GEOJSON
+    return RISK_FGB
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
+import sys
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root, for `src.*` when run as a script
+from src.normalize import minmax01_matrix
+from src.paths import RISK_FGB
+
 try:
     import statsmodels.api as sm
 except Exception:
@@ -11,26 +16,23 @@ except Exception:
 
 TRACTS = Path("data/processed/tracts_hvi.geojson")
 HEALTH = Path("data/raw/health_outcomes.csv")
-OUT    = Path("data/processed/tracts_risk.geojson")
+OUT    = RISK_FGB  # FlatGeobuf: binary, much faster to write/read than GeoJSON
 
 def minmax01(x):
-    x = pd.Series(x, dtype="float64")
-    lo, hi = np.nanpercentile(x, [1, 99])
-    x = x.clip(lo, hi)
-    rng = (x.max() - x.min())
-    return (x - x.min()) / (rng + 1e-9)
+    x = pd.Series(x, dtype="float32")
+    return pd.Series(minmax01_matrix(x.to_numpy()[:, None])[:, 0], index=x.index)
 
 def main():
     # Load tracts & ensure numeric HVI
     g = gpd.read_file(TRACTS).set_index("GEOID", drop=False)
-    g["HVI"] = pd.to_numeric(g.get("HVI"), errors="coerce")
+    g["HVI"] = pd.to_numeric(g.get("HVI"), errors="coerce").astype("float32")
 
     if HEALTH.exists() and sm is not None:
         df = pd.read_csv(HEALTH, dtype={"GEOID": str}).set_index("GEOID")
 
         # numeric + clean
-        df["events"] = pd.to_numeric(df.get("events"), errors="coerce")
-        df["pop"]    = pd.to_numeric(df.get("pop"),    errors="coerce")
+        df["events"] = pd.to_numeric(df.get("events"), errors="coerce").astype("float32")
+        df["pop"]    = pd.to_numeric(df.get("pop"),    errors="coerce").astype("float32")
 
         # Build design on the same index
         X = pd.DataFrame({
@@ -60,16 +62,19 @@ def main():
             res = sm.GLM(y_fit, X_fit, family=sm.families.Poisson(), offset=off_fit).fit()
 
             # Predict expected events for ALL rows (NaN where inputs missing)
-            mu   = res.predict(X, offset=offset)  # aligned to df.index
-            rate = (mu / df["pop"].replace(0, np.nan)) * 1e4  # events per 10k
+            mu   = np.asarray(res.predict(X, offset=offset), dtype=np.float32)  # df row order
+            pop  = df["pop"].to_numpy(dtype=np.float32)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rate = np.where(pop > 0, mu / pop * 1e4, np.nan)  # events per 10k
 
             # Scale to 0–1 risk
-            risk01 = minmax01(rate)
+            risk01 = minmax01_matrix(rate[:, None])[:, 0]
 
-            # Write onto g by GEOID; fill gaps with an HVI-based proxy
-            g["RISK"] = pd.Series(risk01, index=df.index).reindex(g.index)
-            proxy = minmax01((g["HVI"].fillna(0))**1.5)
-            g["RISK"] = g["RISK"].fillna(proxy)
+            # Write onto g by GEOID (row lookup, -1 = no outcomes); fill gaps with an HVI-based proxy
+            row   = df.index.get_indexer(g.index)
+            risk  = np.where(row >= 0, risk01[row], np.nan)
+            proxy = minmax01((g["HVI"].fillna(0))**1.5).to_numpy()
+            g["RISK"] = np.where(np.isnan(risk), proxy, risk)
             g["RISK_src"] = "glm_poisson"
     else:
         # No outcomes or statsmodels: transparent proxy based on HVI
@@ -79,7 +84,7 @@ def main():
     g = g.copy()
     g.index.name = None   # avoid duplicate 'GEOID' on write
 
-    g.to_file(OUT, driver="GeoJSON")
+    g.to_file(OUT, driver="FlatGeobuf")
     print(f"Wrote {OUT} with columns: RISK (0–1), RISK_src")
 
 if __name__ == "__main__":